@@ -22,10 +22,10 @@
 
 import os
 import sys
-import json
-import datetime
-import urlparse
-import psycopg2
+import orjson
+import threading
+import psycopg_pool
+import urllib.parse
 
 sys.path.append(os.path.dirname(__file__))
 
@@ -33,14 +33,40 @@ import uddlib
 from config import HOST, PORT, USER, PASSWORD, DATABASE
 
 
-connection = psycopg2.connect(host=HOST, port=PORT, user=USER,
-    database=DATABASE, password=PASSWORD)
-uddlib.connection = connection
+# All queries are read-only, no need to keep transactions open.
+pool = psycopg_pool.ConnectionPool(min_size=2, max_size=16, open=True,
+    kwargs=dict(host=HOST, port=PORT, user=USER, dbname=DATABASE,
+                password=PASSWORD, autocommit=True))
+uddlib.pool = pool
+
+# Streamed lists hold a connection of the pool until the client has read
+# them, so they may only use half of it. Requests waiting longer than
+# stream_timeout seconds for a slot get a 503 error.
+stream_slots = threading.BoundedSemaphore(8)
+stream_timeout = 10
+
+def stream_objects(cls, filters):
+    """Yield the objects of `cls` matching `filters`, read from a server-side
+    cursor, and release a slot of `stream_slots` when done.
+
+    The generator must be advanced once before it is used: this runs the
+    query, so that database errors are raised before the response is
+    started."""
+    stream = cls.fetch_stream(**filters)
+    try:
+        first = next(stream, None)
+        yield
+        if first is not None:
+            yield first
+            for obj in stream:
+                yield obj
+    finally:
+        stream.close()
+        stream_slots.release()
 
 def dthandler(obj):
-    if isinstance(obj, datetime.datetime):
-        return obj.isoformat()
-    elif isinstance(obj, uddlib.UddResource):
+    # datetime objects are natively serialized by orjson.
+    if isinstance(obj, (uddlib.UddResource, uddlib._LazyRef)):
         return dict(zip(obj.pk, obj._parameter))
         # Not obj.data, because computed_fields would result in circular
         # computation.
@@ -49,55 +75,120 @@ def dthandler(obj):
         # Perform standart serialization
 
 def serialize(data):
-    return json.dumps(data, sort_keys=True, indent=4, default=dthandler)
-
-def get_subclasses(cls):
-    subclasses = []
-    subclasses = cls.__subclasses__()
-    for subclass in cls.__subclasses__():
-        subclasses.extend(get_subclasses(subclass))
-    return subclasses
+    return orjson.dumps(data, default=dthandler,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2)
+
+def serialize_list(items, chunk_size=65536):
+    """Serialize the items as a JSON list, yielding it in chunks of about
+    `chunk_size` bytes instead of building a single string."""
+    chunk = [b'[']
+    size = 1
+    for (i, item) in enumerate(items):
+        if i:
+            chunk.append(b',')
+        body = serialize(item)
+        chunk.append(body)
+        size += len(body) + 1
+        if size >= chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    chunk.append(b']')
+    yield b''.join(chunk)
+
+def serialize_seq(items, chunk_size=65536):
+    """Serialize the items as a JSON text sequence (RFC 7464), yielding it in
+    chunks of about `chunk_size` bytes. Each item is on a single line."""
+    chunk = []
+    size = 0
+    for item in items:
+        body = b'\x1e' + orjson.dumps(item, default=dthandler,
+                option=orjson.OPT_SORT_KEYS) + b'\n'
+        chunk.append(body)
+        size += len(body)
+        if size >= chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    yield b''.join(chunk)
+
+def json_headers(body):
+    return [('Content-type', 'application/json'),
+            ('Content-Length', str(len(body)))]
+
+# The list of resources and their documentation do not change while the
+# application is running, so they are only serialized once.
+root_json = serialize({
+    'info': 'This is a JSON API for the Ultimate Debian Database.',
+    'doc': 'https://github.com/ProgVal/udd-http-api/blob/master/README',
+    'resources': dict([
+        (x.__name__, {'path': x._path, 'doc': (x.__doc__ or '').strip(),})
+        for x in uddlib.UddResource._path_registry.values()]),
+    })
+doc_json_cache = {} # class -> serialized doc
 
 def application(environ, start_response):
     url = [x for x in environ['PATH_INFO'].split('/') if x != '']
 
     if len(url) == 0: # Return list of resources
-        resources = dict([
-            (x.__name__, {'path': x._path, 'doc': (x.__doc__ or '').strip(),})
-            for x in get_subclasses(uddlib.UddResource)])
-        data = {'info': 'This is a JSON API for the Ultimate Debian Database.',
-                'doc': 'https://github.com/ProgVal/udd-http-api/blob/master/README',
-                'resources': resources}
-        start_response('200 OK', [('Content-type', 'application/json')])
-        return [serialize(data)]
+        start_response('200 OK', json_headers(root_json))
+        return [root_json]
 
     if url[0] == 'robots.txt':
         start_response('200 OK', [('Content-type', 'text/plain')])
-        return ['User-agent: *\nDisallow: /']
+        return [b'User-agent: *\nDisallow: /']
 
     
     try:
         cls = uddlib.UddResource.resolve_path(url[0])
     except uddlib.ResourceNotFound:
         start_response('404 Not Found', [('Content-type', 'text/plain')])
-        return ['Resource not found.']
+        return [b'Resource not found.']
 
     if len(url) == 1: # Return a list of objects
-        filters = urlparse.parse_qs(environ['QUERY_STRING'])
-        assert all([(x in cls._fields) for x in filters])
-
-        # We want {'key': 'value'} and not {'key': ['value']}
-        filters = dict([(x,y[0]) for x,y in filters.items()])
-
-        obj = cls.fetch_database(**filters)
-        start_response('200 OK', [('Content-type', 'application/json')])
-        if isinstance(obj, list):
-            return [serialize([x.data for x in obj])]
+        pairs = urllib.parse.parse_qsl(environ['QUERY_STRING'])
+        # Reversed, so the first value given for a filter is used.
+        filters = dict(reversed(pairs))
+        if not cls._fields_set.issuperset(filters):
+            start_response('400 Bad Request', [('Content-type', 'text/plain')])
+            return [b'Filtering on an unknown field.']
+
+        if set(cls._pk_names).issubset(filters):
+            # Objects requested by primary key get all their fields.
+            obj = cls.fetch_database(**filters)
+            if isinstance(obj, list):
+                cls.prefetch_links(obj, cls._computed_fields)
+                start_response('200 OK',
+                        [('Content-type', 'application/json')])
+                return serialize_list(x.data for x in obj)
+            else:
+                body = serialize(obj.data)
+                start_response('200 OK', json_headers(body))
+                return [body]
         else:
-            return [serialize(obj.data)]
+            # Other lists may be big, they are sent while they are read
+            # from the database.
+            if not stream_slots.acquire(timeout=stream_timeout):
+                start_response('503 Service Unavailable',
+                        [('Content-type', 'text/plain')])
+                return [b'Too many lists are being sent, try again later.']
+            objects = stream_objects(cls, filters)
+            next(objects)
+            objects = (x.shallow_data for x in objects)
+            if 'application/json-seq' in environ.get('HTTP_ACCEPT', ''):
+                start_response('200 OK',
+                        [('Content-type', 'application/json-seq')])
+                return serialize_seq(objects)
+            else:
+                start_response('200 OK',
+                        [('Content-type', 'application/json')])
+                return serialize_list(objects)
     elif len(url) == 2 and url[1] == 'doc':
-        start_response('200 OK', [('Content-type', 'application/json')])
-        doc = {'computed fields': dict([(x, getattr(cls, x).__doc__)
-                                   for x in (cls._computed_fields)]),
-               'fields from database': cls._fields}
-        return [serialize(doc)]
+        body = doc_json_cache.get(cls)
+        if body is None:
+            doc = {'computed fields': dict([(x, getattr(cls, x).__doc__)
+                                       for x in (cls._computed_fields)]),
+                   'fields from database': cls._fields}
+            body = doc_json_cache[cls] = serialize(doc)
+        start_response('200 OK', json_headers(body))
+        return [body]
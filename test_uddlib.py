@@ -23,16 +23,19 @@
 import logging
 import unittest
 
-import psycopg2
+import psycopg_pool
 import uddlib
+import index
 
 from config import HOST, PORT, USER, PASSWORD, DATABASE
 
-logging.basicConfig(logLevel=logging.DEBUG)
+logging.basicConfig(level=logging.DEBUG)
 
-connection = psycopg2.connect(host=HOST, port=PORT, user=USER,
-    database=DATABASE, password=PASSWORD)
-uddlib.connection = connection
+# All queries are read-only, no need to keep transactions open.
+pool = psycopg_pool.ConnectionPool(min_size=2, max_size=16, open=True,
+    kwargs=dict(host=HOST, port=PORT, user=USER, dbname=DATABASE,
+                password=PASSWORD, autocommit=True))
+uddlib.pool = pool
 
 class UddlibTestCase(unittest.TestCase):
     def testBug(self):
@@ -47,6 +50,53 @@ class UddlibTestCase(unittest.TestCase):
         self.assertIn(bug2, bug.blocks)
         self.assertIn(bug, bug2.blockedby)
 
+    def testLazyRef(self):
+        bug = uddlib.Bug.fetch_database(pk=24043, fresh=True)
+        # Ids of linked bugs are known without fetching the bugs.
+        self.assertIn(638791, [x.id for x in bug.blocks])
+        self.assertFalse(any([hasattr(x, '_resolved') for x in bug.blocks]))
+        ref = bug.blocks[0]
+        self.assertEqual(ref.title,
+                uddlib.Bug.fetch_database(pk=ref.id).title)
+        self.assertTrue(all([hasattr(x, '_resolved') for x in bug.blocks]))
+
+        ref = uddlib._LazyRef(-1, 'blocks', (bug, (uddlib.Bug,), []))
+        self.assertEqual(ref.id, -1)
+        self.assertRaises(uddlib.CorruptedDatabase, getattr, ref, 'title')
+
+    def testPrefetchLinks(self):
+        def relations(bug):
+            return [sorted(x, key=repr) for x in
+                    ([x.id for x in bug.blocks], [x.id for x in bug.blockedby],
+                     [x.id for x in bug.merged_with], bug.fixed_in,
+                     bug.found_in, bug.tags, bug.usertags, bug.packages)]
+        bugs = [uddlib.Bug.fetch_database(pk=x) for x in (24043, 638791)]
+        uddlib.UddResource.invalidate_cache()
+        uddlib.Bug.prefetch_links(bugs, uddlib.Bug._computed_fields)
+        prefetched = [relations(x) for x in bugs]
+        uddlib.UddResource.invalidate_cache()
+        self.assertEqual(prefetched, [relations(x) for x in bugs])
+
+    def testInvalidate(self):
+        bug = uddlib.Bug.fetch_database(pk=100000)
+        tags = bug.tags
+        self.assertIs(bug, uddlib.Bug.fetch_database(pk=100000))
+        self.assertTrue(hasattr(bug, '_tags'))
+        bug = uddlib.Bug.fetch_database(pk=100000, fresh=True)
+        self.assertFalse(hasattr(bug, '_tags'))
+        self.assertEqual(bug.tags, tags)
+        uddlib.invalidate(uddlib.Bug, 100000)
+        self.assertFalse(hasattr(bug, '_tags'))
+        self.assertEqual(bug.tags, tags)
+
+    def testWarm(self):
+        bug = uddlib.Bug.fetch_database(pk=100000, fresh=True)
+        bug.warm()
+        for name in ('_blocks', '_merged_with', '_tags', '_usertags',
+                     '_packages'):
+            self.assertTrue(hasattr(bug, name))
+        self.assertIn(77039, [x.id for x in bug.merged_with])
+
     def testDevelopper(self):
         dev = uddlib.Developper.fetch_database(pk=1026)
         self.assertEqual(dev.login, 'jamessan')
@@ -60,13 +110,38 @@ class UddlibTestCase(unittest.TestCase):
 
     def testPackage(self):
         pkg = uddlib.Package.fetch_database(package='python2.7')
-        self.failUnless(all([x.package=='python2.7' for x in pkg.subpackages]))
-        self.failUnless(any([x.architecture=='i386' for x in pkg.subpackages]))
-        self.failUnless(any([x.architecture=='ia64' for x in pkg.subpackages]))
+        self.assertTrue(all([x.package=='python2.7' for x in pkg.subpackages]))
+        self.assertTrue(any([x.architecture=='i386' for x in pkg.subpackages]))
+        self.assertTrue(any([x.architecture=='ia64' for x in pkg.subpackages]))
+
+    def testResolvePath(self):
+        self.assertIs(uddlib.UddResource.resolve_path('bugs'), uddlib.Bug)
+        self.assertIs(uddlib.UddResource.resolve_path('popcon_src'),
+                uddlib.PopconSrc)
+        self.assertRaises(uddlib.ResourceNotFound,
+                uddlib.UddResource.resolve_path, 'foo')
 
     def testPopcon(self):
         popcon = uddlib.Popcon.fetch_database()
-        self.failUnless(any([x.package=='python2.7' for x in popcon]))
+        self.assertTrue(any([x.package=='python2.7' for x in popcon]))
+
+        columns = uddlib.Popcon.fetch_columns(('package', 'insts'))
+        self.assertEqual(len(columns['package']), len(popcon))
+        self.assertEqual(len(columns['insts']), len(popcon))
+        self.assertIn('python2.7', columns['package'])
+
+        columns = uddlib.Popcon.bulk_load()
+        self.assertEqual(len(columns['package']), len(popcon))
+        self.assertIn('python2.7', columns['package'])
+
+    def testHttpApi(self):
+        statuses = []
+        def start_response(status, headers):
+            statuses.append(status)
+        body = index.application({'PATH_INFO': '/bugs/',
+                                  'QUERY_STRING': 'foo=bar'}, start_response)
+        self.assertEqual(statuses, ['400 Bad Request'])
+        self.assertEqual(b''.join(body), b'Filtering on an unknown field.')
 
 if __name__ == '__main__':
     unittest.main()
@@ -20,10 +20,23 @@
 
 """Object wrapper of the Ultimate Debian Database."""
 
+import weakref
 import logging
-import psycopg2
-
-connection = None
+import functools
+import threading
+import collections
+import concurrent.futures
+import contextlib
+import cachetools
+import cachetools.keys
+from psycopg import sql
+
+pool = None
+
+# (class, primary key) -> instance, see UddResource._canonical. Objects are
+# only kept while they are used, so streaming a whole table does not keep
+# all its rows in memory.
+_instances = weakref.WeakValueDictionary()
 
 class UddException(Exception):
     """Base exception for everything related to the UDD.
@@ -55,47 +68,317 @@ def data2object(cls, data, table=None):
     :param data: The data from the database
     :returns: The created object
     """
-    assert len(cls._fields) == len(data)
-    kwargs = dict(zip(cls._fields, data))
-    return cls(_table=table, **kwargs)
+    return cls._build_from_row(data, table)
+
+def _field_property(index):
+    """Return a property giving the value of the field at position `index`
+    in the row of an object."""
+    return property(lambda self: self._row[index])
+
+class linked(object):
+    """Decorator declaring a computed field whose value is fetched from
+    a relation table by :method:`uddlib.UddResource._fetch_linked`. The
+    decorated function is given the object and the fetched values, and
+    returns the value of the field, which is cached in the attribute of the
+    same name prefixed with an underscore.
+
+    The queries of the relation are built once, when the class is created,
+    and stored in its `_links` dictionary.
+
+    :param relation_name: The identifier of the relation. For example, for
+                          table `bugs_fixed_in`, `fixed_in` is the
+                          name of the relation
+    :type relation_name: string
+    :param field: The name of the field we want to retrieve. If it is a
+                  string, a single object will be returned. If it is
+                  a tuple, a tuple will be returned.
+    :type field:  string or list of strings
+    :param classes: The list of classes representing the
+                    resource we want to fetch. They
+                    will be tryed in the given order, and the first that
+                    can be used will be used (useful for search both
+                    in `bugs` and `archived_bugs`.
+    :type classes:  list of classes or None
+    :param base_table_name: The base name of the tables involved in the
+                            relation. For example, for table
+                            `bugs` it is `bugs_`, and for
+                            `carnivor_login` it is `carnivor_`.
+
+                            It defaults to the table represented by this
+                            class.
+    :type base_table_name:  string or None
+    :param exclude_from_pk: fields that will not be used as primary key.
+    :type exclude_from_pl: tuple
+    :param tables: The tables of the class whose objects have this relation.
+                   It defaults to all of them; for the others, the
+                   function is given an empty list.
+    :type tables: tuple or None
+    """
+    def __init__(self, relation_name, field, classes=None,
+            base_table_name=None, exclude_from_pk=tuple(), tables=None):
+        self.relation_name = relation_name
+        self.field = field
+        self.classes = classes
+        self.base_table_name = base_table_name
+        self.exclude_from_pk = exclude_from_pk
+        self.tables = tables
+
+    def __call__(self, function):
+        self.function = function
+        self.__doc__ = function.__doc__
+        return self
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.attribute = '_' + name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return getattr(instance, self.attribute)
+        except AttributeError:
+            value = self.function(instance, instance._fetch_linked(self.name))
+            setattr(instance, self.attribute, value)
+            return value
+
+    def compile(self, cls, tables):
+        """Return the entry of `cls._links` for this relation: a tuple
+        (relation name, whether there are multiple fields, classes,
+        dictionary mapping each table of `cls` to the tuple returned by
+        :method:`uddlib.UddResource._linked_query`)."""
+        queries = {}
+        for table in (self.tables or tables):
+            base_table_name = self.base_table_name or (table + '_')
+            queries[table] = cls._linked_query(self.relation_name,
+                    self.field, base_table_name, self.exclude_from_pk)
+        return (self.relation_name, isinstance(self.field, tuple),
+                self.classes, queries)
+
+# Template of the function creating an object from a row, generated for each
+# class by UddResource.__init_subclass__ so that it does not have to go
+# through zip() and keyword arguments. The row itself is stored in the
+# object; the properties of the fields read it by position.
+_BUILD_FROM_ROW_TEMPLATE = '''
+def _build_from_row(cls, data, table=None):
+    instance = cls._canonical((%(pk)s,))
+    instance._row = data
+    if table is not None:
+        instance._instance_table = table
+    return instance
+'''
+
+@contextlib.contextmanager
+def get_conn(binary=False, name=None):
+    """Borrow a connection from the pool for the duration of the `with`
+    block, and give a cursor on it.
+
+    :param bool binary: Whether the results should be fetched using the
+                        binary protocol, which skips parsing the text
+                        representation of numbers and timestamps.
+    :param name: If given, the name of a server-side cursor to create.
+    :type name: string or None
+    """
+    global pool
+    with pool.connection() as conn:
+        if name is None:
+            with conn.cursor(binary=binary) as cur:
+                yield cur
+        else:
+            # Server-side cursors only exist inside a transaction, and
+            # connections are in autocommit mode.
+            with conn.transaction():
+                with conn.cursor(name, binary=binary) as cur:
+                    yield cur
+
+# UDD is only refreshed a few times a day, so the results of the queries
+# issued by UddResource.fetch_database and UddResource._fetch_linked are
+# cached in memory for five minutes.
+# See UddResource.invalidate_cache and invalidate.
+
+def _cache_size(value):
+    """Return the number of rows in a value stored in `_cache`: lists of
+    rows count for their length, single rows (or None) for one."""
+    if isinstance(value, tuple) and value and isinstance(value[0], tuple):
+        return len(value)
+    else:
+        return 1
+
+# The size of the cache is counted in rows, so big lists (such as the whole
+# popcon table) are not kept: cachetools does not store values larger than
+# the cache.
+_cache = cachetools.TTLCache(maxsize=100000, ttl=300,
+        getsizeof=_cache_size)
+_cache_lock = threading.Lock()
+
+_missing = object()
+
+def _cache_key(kind, *args):
+    """Return the key of `_cache` for the result of the function decorated
+    with `_cached(kind)`, called with `args`."""
+    return cachetools.keys.hashkey(kind, *args)
+
+def _cache_get(key):
+    """Return the value cached for `key`, or `_missing`."""
+    with _cache_lock:
+        return _cache.get(key, _missing)
+
+def _cache_set(key, value):
+    """Cache the `value` for `key`, unless it is larger than the cache."""
+    with _cache_lock:
+        try:
+            _cache[key] = value
+        except ValueError:
+            pass
+
+def _cached(kind):
+    """Decorator caching the results of the function in `_cache`, with
+    keys starting with `kind` and the class of the object."""
+    return cachetools.cached(_cache, lock=_cache_lock,
+            key=functools.partial(_cache_key, kind))
+
+@_cached('pk')
+def _fetch_pk_cached(cls, tables, fields, pk):
+    """Return the row whose first field is `pk` in the first of `tables`
+    which has one, as a tuple (table, row), or None."""
+    query = cls._select_by_pks(tables, fields)
+    logging.debug('query: %s', query)
+
+    with get_conn(binary=cls._binary) as cur:
+        # The query is prepared on the server, so its plan is reused by the
+        # next lookups on this connection.
+        cur.execute(query, {'pks': [pk]}, prepare=True)
+        rows = cur.fetchall()
+    if not rows:
+        return None
+    data = min(rows, key=lambda data: data[0])
+    return (tables[data[0]], data[1:])
+
+@_cached('where')
+def _fetch_where_cached(cls, table, fields, where):
+    """Return a tuple of the rows of `table` matching `where`, which is
+    a tuple of (field, value) pairs."""
+    query = cls._select_where(table, fields,
+            tuple([key for (key, value) in where]))
+    logging.debug('query: %s', query)
+
+    with get_conn(binary=cls._binary) as cur:
+        cur.execute(query, [value for (key, value) in where])
+        return tuple(cur.fetchall())
+
+@_cached('linked')
+def _fetch_linked_cached(cls, query, parameter):
+    """Return a tuple of the rows returned by the `query` of
+    :method:`uddlib.UddResource._fetch_linked`."""
+    logging.debug('query: %s', query)
+
+    with get_conn() as cur:
+        cur.execute(query, parameter, prepare=True)
+        return tuple(cur.fetchall())
+
+@_cached('relations')
+def _fetch_relations_cached(cls, base_table_name, id):
+    """Return the row returned by the query of
+    :method:`uddlib.Bug._fetch_all_relations` for the table
+    `base_table_name`."""
+    query = cls._all_relations_query(base_table_name)
+    logging.debug('query: %s', query)
+
+    with get_conn() as cur:
+        cur.execute(query, {'id': id}, prepare=True)
+        return cur.fetchone()
+
+def invalidate(cls, pk):
+    """Forget the cached data of the object of class `cls` whose first
+    field is `pk`, and the cached lists of objects of this class.
+
+    :param cls: An UddResource subclass
+    :param pk: The value of the first field of the object, as given to
+               :method:`uddlib.UddResource.fetch_database`.
+    """
+    with _cache_lock:
+        for key in list(_cache.keys()):
+            if key[1] is not cls:
+                continue
+            elif key[0] == 'where' or \
+                    (key[0] == 'pk' and key[4] == pk) or \
+                    (key[0] == 'linked' and key[3][:1] == (pk,)) or \
+                    (key[0] == 'relations' and key[3] == pk):
+                _cache.pop(key, None)
+    instance = _instances.get((cls, (pk,)))
+    if instance is not None:
+        _reset_computed_fields(instance)
+
+def _reset_computed_fields(instance):
+    """Forget the computed fields cached by the object itself, in the
+    __slots__ of its class."""
+    for klass in type(instance).__mro__[:-2]: # Skip UddResource and object
+        for name in vars(klass).get('__slots__', ()):
+            if hasattr(instance, name):
+                delattr(instance, name)
 
 class UddResource(object):
     """Base class representing an entry in the database.
     """
 
-    _singleton = True
-    __instances = {}
-    def __new__(cls, **kwargs):
-        # This implements the Parametric Singleton design pattern.
-        pk = cls._pk or (cls._fields[0],)
-        id = tuple(kwargs[x] for x in pk)
-        if not cls._singleton:
-            instance = object.__new__(cls)
-            instance._parameter = id
-            return instance
-        if cls not in cls.__instances:
-            cls.__instances[cls] = {}
-        if id not in cls.__instances[cls]:
+    # Subclasses declare the attributes caching their computed fields in
+    # __slots__ as well, so instances do not need a __dict__.
+    __slots__ = ('_row', '_parameter', '_instance_table', '__weakref__')
+
+    _path_registry = {} # path -> subclass
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        assert cls._path is not None
+        assert cls._table is not None
+        # Fields are a tuple, so they can be used in cache keys.
+        assert isinstance(cls._fields, tuple)
+        if '_path' in vars(cls):
+            UddResource._path_registry[cls._path] = cls
+        cls._select_queries = {}
+        # Fields are always selected explicitly, so the order of the columns
+        # in the tables does not matter.
+        cls._fields_sql = sql.SQL(', ').join(map(sql.Identifier, cls._fields))
+        tables = cls._table
+        if not isinstance(tables, tuple):
+            tables = (tables,)
+        cls._tables = tables
+        cls._fields_set = frozenset(cls._fields)
+        # Position of each field in the rows stored by the objects.
+        cls._field_index = dict([(x, i) for (i, x) in enumerate(cls._fields)])
+        # Column used for lookups by primary key by fetch_database.
+        cls._pk_col = cls._fields[0]
+        cls._pk_names = cls._pk or (cls._pk_col,)
+        cls._pk_idx = tuple([cls._field_index[x] for x in cls._pk_names])
+        source = _BUILD_FROM_ROW_TEMPLATE % {
+                'pk': ', '.join(['data[%i]' % i for i in cls._pk_idx]),
+                }
+        namespace = {}
+        exec(source, namespace)
+        cls._build_from_row = classmethod(namespace['_build_from_row'])
+        cls._links = {}
+        for klass in reversed(cls.__mro__):
+            for (name, value) in vars(klass).items():
+                if isinstance(value, linked):
+                    cls._links[name] = value.compile(cls, tables)
+        # Fields are properties, so reading them does not need to go through
+        # __getattr__. Attributes defined by the class take precedence.
+        for (name, index) in cls._field_index.items():
+            if not hasattr(cls, name):
+                setattr(cls, name, _field_property(index))
+
+    @classmethod
+    def _canonical(cls, id):
+        """Return the only instance of this class with the given primary
+        key, which is a tuple. This implements the Parametric Singleton
+        design pattern; objects are created with :func:`data2object`.
+        """
+        instance = _instances.get((cls, id))
+        if instance is None:
             instance = object.__new__(cls)
             instance._parameter = id
-            cls.__instances[cls][id] = instance
-        return cls.__instances[cls][id]
-
-    def __init__(self, _table=None, **kwargs):
-        assert self._path is not None
-        assert self._table is not None
-        assert self._fields is not None
-        self._data = kwargs
-        if _table is not None:
-            self._table = _table
-
-    def __getattr__(self, name):
-        if name in self.__dict__:
-            return self.__dict__[name]
-        elif name in self._fields:
-            return self._data[name]
-        else:
-            raise AttributeError(name)
+            _instances[(cls, id)] = instance
+        return instance
 
     def __repr__(self):
         return '%s.%s(%s)' % (self.__class__.__module__,
@@ -103,8 +386,15 @@ class UddResource(object):
                 ', '.join(['%s=%r'%x for x in zip(self.pk, self._parameter)]))
 
     def __eq__(self, other):
-        return self._data == other._data
-        
+        # Objects are identified by their class and primary key, like the
+        # Parametric Singleton does.
+        if not isinstance(other, UddResource):
+            return NotImplemented
+        return type(self) is type(other) and \
+                self._parameter == other._parameter
+
+    def __hash__(self):
+        return hash((type(self), self._parameter))
 
     # This attributes should be read-only, and set by all subclasses.
     _pk = None # tuple or None
@@ -112,12 +402,18 @@ class UddResource(object):
     _table = None # string
     _fields = None # tuple
     _computed_fields = tuple()
+    # Computed fields which do not need to query the database, and are part
+    # of shallow_data.
+    _shallow_computed_fields = tuple()
+    # psycopg has no binary loader for some UDD types (debversion, enums
+    # such as bugs_severity), which would be returned as raw bytes.
+    _binary = True
 
     @property
     def pk(self):
         """The primary key of this resource.
         """
-        return self._pk or (self._fields[0],)
+        return self._pk_names
 
     @property
     def path(self):
@@ -130,25 +426,29 @@ class UddResource(object):
     def table(self):
         """The table containing this resource.
         """
-        # We use a property to make this read-only.
-        return self._table
+        try:
+            return self._instance_table
+        except AttributeError:
+            return self._tables
 
     @property
     def data(self):
         """The data of this object.
         """
-        return dict(self._data.items() + [(x, getattr(self, x))
-            for x in self._computed_fields])
+        data = dict(zip(self._fields, self._row))
+        for name in self._computed_fields:
+            data[name] = getattr(self, name)
+        return data
 
-    @staticmethod
-    def cursor():
-        """Return a cursor for the database connection.
-        
-        :return: the cursor.
+    @property
+    def shallow_data(self):
+        """The data of this object, without the computed fields which need
+        to query the database.
         """
-        global connection
-        assert connection is not None
-        return connection.cursor()
+        data = dict(zip(self._fields, self._row))
+        for name in self._shallow_computed_fields:
+            data[name] = getattr(self, name)
+        return data
 
     @classmethod
     def resolve_path(cls, path):
@@ -158,20 +458,28 @@ class UddResource(object):
         :return: an UddResource subclass, serving this path.
         :raises ResourceNotFound: if the path cannot be resolved.
         """
-        for subclass in cls.__subclasses__():
-            if subclass._path == path:
-                return subclass
-        raise ResourceNotFound()
+        try:
+            return cls._path_registry[path]
+        except KeyError:
+            raise ResourceNotFound()
     
     @classmethod
-    def fetch_database(cls, pk=None, fields=None, _table=None, **kwargs):
+    def fetch_database(cls, pk=None, fields=None, _table=None, fresh=False,
+            **kwargs):
         """Returns all objects of this resource matching the criterions.
 
         :param pk: The primary key. If this parameter is given, an instance of
                    this class will be returned.
                    Otherwise, it will be a list of instances of this class.
         :param list fields: A list of fields that will be fetched.
-                            It defaults to all fields.
+                            It defaults to all fields. If it is given,
+                            tuples of the values of these fields are
+                            returned instead of instances (see also
+                            :method:`uddlib.UddResource.fetch_columns`).
+        :param bool fresh: Only valid if `pk` is given. If true, the object
+                           is read again from the database instead of the
+                           cache, and its cached data is forgotten (see
+                           :func:`invalidate`).
         :param dict **kwargs: Only valid if `pk` is not given.
                             Only objects matching this conditions (field given
                             as key must have the given value) will be
@@ -181,156 +489,382 @@ class UddResource(object):
         :raises ObjectNotFound: if pk is given and no objects have this
                                 primary key.
         """
-        table = _table or cls._table
-        if isinstance(table, tuple):
-            results = []
-            if pk is None:
-                for table in table:
-                    try:
-                        results.extend(cls.fetch_database(pk, fields, table,
-                            **kwargs))
-                    except ObjectNotFound:
-                        pass
-            else:
-                for table in table:
-                    try:
-                        return cls.fetch_database(pk, fields, table,
-                            **kwargs)
-                    except ObjectNotFound:
-                        pass
-            return results
-        fields = fields or '*'
-        query = 'SELECT %(fields)s FROM %(table)s %(where)s'
+        if pk is not None and fresh:
+            invalidate(cls, pk)
+        tables = _table or cls._tables
+        if not isinstance(tables, tuple):
+            tables = (tables,)
+        if fields:
+            fields = tuple(fields)
+            assert cls._fields_set.issuperset(fields)
+            # Objects are only built from whole rows: the properties read
+            # the fields by position.
+            build = lambda data, table: data
+        else:
+            fields = None
+            build = lambda data, table: data2object(cls, data, (table,))
 
         if pk is None:
-            # TODO: rewrite this to make it less dependant on the order of
-            # items returned by .keys() and .values().
-            where_clause = ' AND '.join([key+'=%s' for key in kwargs.keys()])
-            where_params = kwargs.values()
-            if where_clause != '':
-                where_clause = 'WHERE ' + where_clause
-
-            query %= {
-                    'fields': fields,
-                    'table': table,
-                    'where': where_clause,
-                    }
-            logging.debug('query: ' + query)
-
-            objects = []
-            cur = cls.cursor() # __exit__ not implemented in psycopg2
-            try:
-                cur.execute(query, where_params)
-
-                while True:
-                    data = cur.fetchone()
-                    if data is None:
-                        break
-                    objects.append(data2object(cls, data, (table,)))
-            finally:
-                cur.close()
-
-            return objects
+            where = tuple(sorted(kwargs.items()))
+            return [build(data, table)
+                    for table in tables
+                    for data in _fetch_where_cached(cls, table, fields, where)]
+        else:
+            result = _fetch_pk_cached(cls, tables, fields, pk)
+            if result is None:
+                raise ObjectNotFound()
+            else:
+                (table, data) = result
+                return build(data, table)
+
+    @classmethod
+    def fetch_stream(cls, **kwargs):
+        """Yield all objects of this resource matching the criterions, like
+        :method:`uddlib.UddResource.fetch_database` without `pk`.
+
+        Rows are read from a server-side cursor, which sends them by batches
+        of `itersize` rows, so the whole result is never held in memory
+        (and it is not cached either). This is meant for big tables, such
+        as `bugs` or `popcon`.
+        """
+        tables = cls._tables
+        keys = tuple(sorted(kwargs))
+        for table in tables:
+            query = cls._select_where(table, None, keys)
+            logging.debug('query: %s', query)
+            with get_conn(binary=cls._binary, name='udd_stream') as cur:
+                cur.itersize = 2000
+                cur.execute(query, [kwargs[key] for key in keys])
+                for data in cur:
+                    yield data2object(cls, data, (table,))
+
+    @classmethod
+    def invalidate_cache(cls):
+        """Forget the results of all queries made by
+        :method:`uddlib.UddResource.fetch_database` and
+        :method:`uddlib.UddResource._fetch_linked`, for all resources,
+        including the computed fields cached by the objects in use.
+        """
+        with _cache_lock:
+            _cache.clear()
+        for instance in list(_instances.values()):
+            _reset_computed_fields(instance)
+
+    @classmethod
+    def fetch_columns(cls, columns, **kwargs):
+        """Returns some fields of all objects of this resource matching the
+        criterions, without creating the objects. This is cheaper than
+        :method:`uddlib.UddResource.fetch_database` for scanning many rows.
+
+        :param list columns: Names of the fields to fetch.
+        :param dict **kwargs: Only objects matching this conditions (field
+                              given as key must have the given value) will be
+                              returned.
+        :returns: a dictionary mapping each field name to the list of its
+                  values, in the same order for all fields.
+        """
+        columns = tuple(columns)
+        assert cls._fields_set.issuperset(columns)
+        tables = cls._tables
+        keys = tuple(sorted(kwargs))
+        results = dict([(column, []) for column in columns])
+        for table in tables:
+            query = cls._select_where(table, columns, keys)
+            logging.debug('query: %s', query)
+            with get_conn(binary=cls._binary) as cur:
+                cur.execute(query, [kwargs[key] for key in keys])
+                rows = cur.fetchall()
+            for (column, values) in zip(columns, zip(*rows)):
+                results[column].extend(values)
+        return results
+
+    @classmethod
+    def _select_where(cls, table, fields, keys):
+        """Return the query selecting `fields` (or all fields if it is None)
+        of the rows of `table` where each field in `keys` is equal to
+        a parameter. Queries are composed and converted to a string once
+        per shape, with `keys` in a canonical (sorted) order.
+        """
+        query = cls._select_queries.get((table, fields, keys))
+        if query is None:
+            if fields:
+                fields_sql = sql.SQL(', ').join(map(sql.Identifier, fields))
+            else:
+                fields_sql = cls._fields_sql
+            query = sql.SQL('SELECT {fields} FROM {table}').format(
+                    fields=fields_sql, table=sql.Identifier(table))
+            if keys:
+                query += sql.SQL(' WHERE ') + sql.SQL(' AND ').join(
+                        [sql.SQL('{} = %s').format(sql.Identifier(key))
+                         for key in keys])
+            query = query.as_string(None)
+            cls._select_queries[(table, fields, keys)] = query
+        return query
+
+    @classmethod
+    def _select_by_pks(cls, tables, fields):
+        """Return the query selecting `fields` (or all fields if it is None)
+        of the rows of `tables` whose first field is in the `pks` parameter,
+        with a single query. The first column of the result is the index
+        of the table the row comes from, in `tables`.
+        """
+        query = cls._select_queries.get((tables, fields, None))
+        if query is None:
+            if fields:
+                fields_sql = sql.SQL(', ').join(map(sql.Identifier, fields))
+            else:
+                fields_sql = cls._fields_sql
+            query = sql.SQL(' UNION ALL ').join([
+                sql.SQL('SELECT {index}, {fields} FROM {table} '
+                        'WHERE {pk} = ANY(%(pks)s)').format(
+                    index=sql.Literal(index),
+                    fields=fields_sql,
+                    table=sql.Identifier(table),
+                    pk=sql.Identifier(cls._pk_col))
+                for (index, table) in enumerate(tables)]).as_string(None)
+            cls._select_queries[(tables, fields, None)] = query
+        return query
+
+    @classmethod
+    def _fetch_by_pks(cls, pks):
+        """Fetch all objects whose primary key is in the given list, using
+        a single query on all the tables of this resource.
+
+        :param list pks: Values of the first field of the objects.
+        :returns: a dictionary mapping each found primary key to its object.
+        """
+        if not pks:
+            return {}
+        tables = cls._tables
+        query = cls._select_by_pks(tables, None)
+        logging.debug('query: %s', query)
+        with get_conn(binary=cls._binary) as cur:
+            cur.execute(query, {'pks': list(pks)}, prepare=True)
+            rows = cur.fetchall()
+        # If a primary key is in several tables, the first table wins, like
+        # in fetch_database.
+        indexes = {}
+        for data in rows:
+            (index, pk) = (data[0], data[1])
+            if indexes.get(pk, index) >= index:
+                indexes[pk] = index
+        return dict([(data[1], data2object(cls, data[1:], (tables[data[0]],)))
+                     for data in rows if indexes[data[1]] == data[0]])
+
+    @classmethod
+    def _linked_query(cls, relation_name, field, base_table_name,
+            exclude_from_pk):
+        """Return the query used by :method:`_fetch_linked`, the indexes
+        of its parameters in the primary key, and the query used by
+        :method:`prefetch_links` (None if the relation uses more than one
+        field of the primary key). It is called by :method:`linked.compile`
+        when the class is created.
+        """
+        if not isinstance(field, tuple):
+            field = (field,)
+        pk_indices = tuple([i for (i, x) in enumerate(cls._pk_names)
+                            if x not in exclude_from_pk])
+        fields_sql = sql.SQL(', ').join(map(sql.Identifier, field))
+        table_sql = sql.Identifier(base_table_name + relation_name)
+        query = sql.SQL('SELECT {fields} FROM {table} WHERE {where};').format(
+                fields=fields_sql,
+                table=table_sql,
+                where=sql.SQL(' AND ').join([
+                    sql.SQL('{} = %s').format(sql.Identifier(cls._pk_names[i]))
+                    for i in pk_indices]))
+        if len(pk_indices) == 1:
+            # The first column tells which object each row belongs to.
+            prefetch_query = sql.SQL('SELECT {pk}, {fields} FROM {table} '
+                                     'WHERE {pk} = ANY(%s);').format(
+                    pk=sql.Identifier(cls._pk_names[pk_indices[0]]),
+                    fields=fields_sql,
+                    table=table_sql).as_string(None)
         else:
-            query %= {
-                    'fields': fields,
-                    'table': table,
-                    'where': 'WHERE ' + cls._fields[0] + ' = %s',
+            prefetch_query = None
+        return (query.as_string(None), pk_indices, prefetch_query)
+
+    def _fetch_linked(self, name):
+        """Fetch the objects linked to this one by a relation.
+
+        :param name: The name of the computed field declared with
+                     :class:`uddlib.linked`.
+        :type name: string
+        """
+        queries = self._links[name][3]
+        rows = []
+        for table in self.table:
+            if table in queries:
+                (query, pk_indices, prefetch_query) = queries[table]
+                parameter = tuple([self._parameter[i] for i in pk_indices])
+                rows.extend(_fetch_linked_cached(type(self), query, parameter))
+        return self._linked_objects(name, rows)
+
+    def _linked_objects(self, name, rows):
+        """Return the objects linked to this one by a relation, from the
+        rows fetched from its table."""
+        (relation_name, multiple_fields, classes, queries) = self._links[name]
+        if classes is None: # Native data
+            if multiple_fields:
+                objects = rows
+            else:
+                objects = [data[0] for data in rows]
+                missing = [data for data, obj in zip(rows, objects)
+                           if obj is None]
+                if missing:
+                    raise self._corrupted(relation_name, missing[0][0])
+        else: # many-to-many relation
+            # Linked objects are only fetched when they are used.
+            batch = (self, classes, [])
+            if multiple_fields:
+                objects = [[_LazyRef(x, relation_name, batch) for x in data]
+                           for data in rows]
+            else:
+                objects = [_LazyRef(data[0], relation_name, batch)
+                           for data in rows]
+        return objects
+
+    @classmethod
+    def prefetch_links(cls, instances, relations):
+        """Fetch some linked fields of many objects, with one query per
+        relation and table instead of one query per object.
+
+        :param list instances: The objects, instances of this class.
+        :param list relations: The names of the fields. Names which are
+                               not declared with :class:`uddlib.linked`
+                               are ignored.
+        """
+        instances = list(instances)
+        for name in relations:
+            if name not in cls._links:
+                continue
+            queries = cls._links[name][3]
+            attribute = '_' + name
+            pending = [x for x in instances if not hasattr(x, attribute)]
+            if any([x[2] is None for x in queries.values()]):
+                # The relation uses several fields of the primary key.
+                for instance in pending:
+                    getattr(instance, name)
+                continue
+            # Rows are shared with _fetch_linked through the 'linked' entries
+            # of the cache; only the missing ones are queried.
+            rows = {} # (table, pk) -> rows
+            missing = collections.defaultdict(list) # table -> primary keys
+            for instance in pending:
+                for table in instance.table:
+                    if table in queries:
+                        (query, pk_indices, prefetch_query) = queries[table]
+                        pk = instance._parameter[pk_indices[0]]
+                        data = _cache_get(_cache_key('linked', cls, query,
+                                                     (pk,)))
+                        if data is _missing:
+                            missing[table].append(pk)
+                        else:
+                            rows[(table, pk)] = data
+            for (table, pks) in missing.items():
+                (query, pk_indices, prefetch_query) = queries[table]
+                fetched = dict([(pk, []) for pk in pks])
+                logging.debug('query: %s', prefetch_query)
+                with get_conn() as cur:
+                    cur.execute(prefetch_query, [pks], prepare=True)
+                    for data in cur:
+                        fetched[data[0]].append(data[1:])
+                for (pk, data) in fetched.items():
+                    data = tuple(data)
+                    _cache_set(_cache_key('linked', cls, query, (pk,)), data)
+                    rows[(table, pk)] = data
+            function = getattr(cls, name).function
+            for instance in pending:
+                data = []
+                for table in instance.table:
+                    if table in queries:
+                        pk = instance._parameter[queries[table][1][0]]
+                        data.extend(rows[(table, pk)])
+                setattr(instance, attribute, function(instance,
+                        instance._linked_objects(name, data)))
+
+    @staticmethod
+    def _fetch_candidates(classes, pks):
+        """Fetch objects from their primary keys, trying the given classes
+        in order.
+
+        :returns: a dictionary mapping each found primary key to its object.
+        """
+        instances = {}
+        for cls in classes:
+            instances.update(cls._fetch_by_pks(
+                [x for x in pks if x not in instances]))
+        return instances
+
+    def _corrupted(self, relation_name, pk):
+        """Return the exception raised when this object is linked by
+        `relation_name` to an object that does not exist."""
+        return CorruptedDatabase(('`%(obj)r` has relationship '
+                '`%(rel)s` with inexisting element: `%(pk)s`') % {
+                    'obj': self,
+                    'rel': relation_name,
+                    'pk': pk,
                     }
-            logging.debug('query: ' + query)
-            
-            cur = cls.cursor() # __exit__ not implemented in psycopg2
-            try:
-                cur.execute(query, [pk])
-                data = cur.fetchone()
-                if data is None:
-                    raise ObjectNotFound()
-                else:
-                    return data2object(cls, data, (table,))
-            finally:
-                cur.close()
-
-    def _fetch_linked(self, relation_name, field, classes=None,
-            base_table_name=None, exclude_from_pk=tuple()):
-        """Fetch a linked object.
-
-        :param relation_name: The identifier of the relation. For example, for
-                              table `bugs_fixed_in`, `fixed_in` is the
-                              name of the relation
-        :type relation_name: string
-        :param field: The name of the field we want to retrieve. If it is a
-                      string, a single object will be returned. If it is
-                      a tuple, a tuple will be returned.
-        :type field:  string or list of strings
-        :param classes: The class or the list of classes representing the
-                        resource we want to fetch. If it is a list, they
-                        will be tryed in the given order, and the first that
-                        can be used will be used (useful for search both
-                        in `bugs` and `archived_bugs`.
-        :type classes:  class or list of classes or None
-        :param base_table_name: The base name of the tables involved in the
-                                relation. For example, for table
-                                `bugs` it is `bugs_`, and for
-                                `carnivor_login` it is `carnivor_`.
-
-                                It defaults to the table represented by this
-                                class.
-        :type base_table_name:  string or None
-        :param exclude_from_pk: fields that will not be used as primary key.
-        :type exclude_from_pl: tuple
+                )
+
+class _LazyRef(object):
+    """Reference to an object linked to another one, which is only fetched
+    from the database when it is used. Its primary key can be read without
+    fetching it.
+
+    References created by the same access to a relation share a batch,
+    a tuple (object they are linked to, candidate classes, references),
+    and are all fetched with a single query when one of them is used.
+    """
+    __slots__ = ('_parameter', '_relation_name', '_batch', '_resolved')
+
+    def __init__(self, pk, relation_name, batch):
+        self._parameter = (pk,)
+        self._relation_name = relation_name
+        self._batch = batch
+        batch[2].append(self)
+
+    @property
+    def pk(self):
+        """The primary key of the referenced object.
         """
-        if base_table_name is None:
-            base_table_name = tuple([x + '_' for x in self._table])
-        if isinstance(base_table_name, tuple):
-            results = []
-            for table in base_table_name:
-                results.extend(self._fetch_linked(relation_name, field,
-                        classes, table))
-            return results
-        multiple_fields = isinstance(field, tuple)
-        if multiple_fields:
-            field = ', '.join(field)
-        objects = []
-        query = 'SELECT %s FROM %s%s WHERE %s;' % \
-                (field, base_table_name, relation_name,
-                        ' AND '.join([(x + '=%s') for x in self._pk
-                            if x not in exclude_from_pk]))
-        cur = self.cursor()
+        return self._batch[1][0]._pk_names
+
+    def _resolve(self):
+        """Return the referenced object, fetching it (and the other
+        references of the batch) if needed."""
         try:
-            parameter = [y for x,y in zip(self._pk, self._parameter)
-                    if x not in exclude_from_pk]
-            cur.execute(query, parameter)
-            while True:
-                data = cur.fetchone()
-                if data is None:
-                    break
-                obj = None
-                if classes is None: # Native data
-                    if multiple_fields:
-                        obj = data
-                    else:
-                        obj = data[0]
-                else: # many-to-many relation
-                    for cls in classes:
-                        try:
-                            if multiple_fields:
-                                obj = [cls.fetch_database(pk=x) for x in data]
-                            else:
-                                obj = cls.fetch_database(pk=data[0])
-                        except ObjectNotFound as e:
-                            pass
-                if obj is None:
-                    raise CorruptedDatabase(('`%(obj)r` has relationship '
-                            '`%(rel)s` with inexisting element: `%(pk)s`') % {
-                                'obj': self,
-                                'rel': relation_name,
-                                'pk': data[0],
-                                }
-                            )
-                objects.append(obj)
-        finally:
-            cur.close()
-        return objects
+            return self._resolved
+        except AttributeError:
+            (owner, classes, refs) = self._batch
+            refs = [x for x in refs if not hasattr(x, '_resolved')]
+            instances = UddResource._fetch_candidates(classes,
+                    set([x._parameter[0] for x in refs]))
+            for ref in refs:
+                if ref._parameter[0] not in instances:
+                    raise owner._corrupted(ref._relation_name,
+                            ref._parameter[0])
+                ref._resolved = instances[ref._parameter[0]]
+            return self._resolved
+
+    def __getattr__(self, name):
+        if name in _LazyRef.__slots__:
+            # Unset slot
+            raise AttributeError(name)
+        elif name in self.pk:
+            return self._parameter[self.pk.index(name)]
+        else:
+            return getattr(self._resolve(), name)
+
+    def __repr__(self):
+        return '%s.%s(%s, %s)' % (self.__class__.__module__,
+                self.__class__.__name__, self._batch[1][0].__name__,
+                ', '.join(['%s=%r'%x for x in zip(self.pk, self._parameter)]))
+
+    def __eq__(self, other):
+        return self._resolve() == other
+
+    def __hash__(self):
+        return hash(self._resolve())
 
 class Bug(UddResource):
     """Base class for active and inactive bugs.
@@ -344,88 +878,204 @@ class Bug(UddResource):
     'done_date')
     _computed_fields = ('blocks', 'blockedby', 'merged_with', 'fixed_in',
     'found_in', 'tags', 'usertags', 'packages', 'archived')
+    _shallow_computed_fields = ('archived',)
+    __slots__ = ('_blocks', '_blockedby', '_merged_with', '_fixed_in',
+    '_found_in', '_tags', '_usertags', '_packages')
 
     _path = 'bugs'
     _table = ('bugs', 'archived_bugs')
+    _binary = False # `severity` is a bugs_severity enum
+
+    # Relations fetched at once by _fetch_all_relations, as pairs
+    # (relation name, field).
+    _bug_relations = (('blocks', 'blocked'), ('blockedby', 'blocker'),
+            ('merged_with', 'merged_with'))
+    _native_relations = (('fixed_in', 'version'), ('found_in', 'version'),
+            ('tags', 'tag'))
+    # Computed fields fetched by independent queries, see warm. `blocks`
+    # fetches all the relations of _fetch_all_relations.
+    _warm_fields = ('blocks', 'usertags', 'packages')
 
     @property
     def archived(self):
         """Determines whether or not this bug is archived or not."""
-        return ('bugs' not in self._table)
+        return ('bugs' not in self.table)
+
+    def warm(self, executor=None):
+        """Fetch the computed fields of this bug concurrently, each query
+        using its own connection from the pool, so this takes about as
+        long as the slowest query instead of all of them in a row.
+
+        :param executor: The executor running the queries. If it is None,
+                         a thread pool is created for this call.
+        :type executor: concurrent.futures.Executor or None
+        """
+        if executor is None:
+            with concurrent.futures.ThreadPoolExecutor(
+                    len(self._warm_fields)) as executor:
+                return self.warm(executor)
+        # Each field is cached in its own attributes, so the threads do not
+        # need to be synchronized.
+        futures = [executor.submit(getattr, self, name)
+                   for name in self._warm_fields]
+        for future in futures:
+            future.result()
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def _all_relations_query(cls, base_table_name, many=False):
+        """Return the query used by :method:`_fetch_all_relations`, or the
+        one used by :method:`prefetch_links` if `many` is true."""
+        if many:
+            id_sql = sql.SQL('ids.id')
+        else:
+            id_sql = sql.SQL('%(id)s')
+        subqueries = sql.SQL(', ').join([
+                sql.SQL('(SELECT array_agg({}) FROM {} WHERE id = {})')
+                    .format(sql.Identifier(field),
+                            sql.Identifier(base_table_name + relation_name),
+                            id_sql)
+                for (relation_name, field)
+                in cls._bug_relations + cls._native_relations])
+        if many:
+            query = sql.SQL('SELECT ids.id, {} '
+                            'FROM unnest(%(ids)s) AS ids(id);')
+        else:
+            query = sql.SQL('SELECT {};')
+        return query.format(subqueries).as_string(None)
+
+    def _fetch_all_relations(self):
+        """Fetch the bugs this bug is linked to, its versions and its tags
+        with a single query per table, and cache them in their properties.
+        """
+        self._set_relations([
+                _fetch_relations_cached(type(self), table + '_', self.id)
+                for table in self.table])
+
+    @classmethod
+    def prefetch_links(cls, instances, relations):
+        """Like :method:`uddlib.UddResource.prefetch_links`. The relations
+        fetched by :method:`_fetch_all_relations` are fetched all together,
+        with one query per table."""
+        instances = list(instances)
+        names = set([relation_name for (relation_name, field)
+                     in cls._bug_relations + cls._native_relations])
+        if names.intersection(relations):
+            pending = [x for x in instances if not hasattr(x, '_blocks')]
+            # Rows are shared with _fetch_all_relations through the
+            # 'relations' entries of the cache; only the missing ones are
+            # queried.
+            rows = {} # (table, id) -> row
+            missing = collections.defaultdict(list) # table -> ids
+            for bug in pending:
+                for table in bug.table:
+                    row = _cache_get(_cache_key('relations', cls,
+                                                table + '_', bug.id))
+                    if row is _missing:
+                        missing[table].append(bug.id)
+                    else:
+                        rows[(table, bug.id)] = row
+            for (table, ids) in missing.items():
+                query = cls._all_relations_query(table + '_', True)
+                logging.debug('query: %s', query)
+                with get_conn() as cur:
+                    cur.execute(query, {'ids': ids}, prepare=True)
+                    for row in cur:
+                        _cache_set(_cache_key('relations', cls, table + '_',
+                                              row[0]), row[1:])
+                        rows[(table, row[0])] = row[1:]
+            for bug in pending:
+                bug._set_relations([rows[(table, bug.id)]
+                                    for table in bug.table])
+        super().prefetch_links(instances,
+                [x for x in relations if x not in names])
+
+    def _set_relations(self, rows):
+        """Cache the results of the queries of :method:`_all_relations_query`
+        in the properties of this bug."""
+        relations = self._bug_relations + self._native_relations
+        results = dict([(relation_name, [])
+                        for (relation_name, field) in relations])
+        for row in rows:
+            for ((relation_name, field), values) in zip(relations, row):
+                results[relation_name].extend(values or [])
+
+        # Linked bugs are only fetched when they are used, all at once.
+        batch = (self, (Bug,), [])
+        for (relation_name, field) in self._bug_relations:
+            results[relation_name] = [_LazyRef(pk, relation_name, batch)
+                                      for pk in results[relation_name]]
+
+        for (relation_name, field) in relations:
+            setattr(self, '_' + relation_name, results[relation_name])
 
-    _blocks = None
     @property
     def blocks(self):
         """Bugs this bug blocks."""
-        if self._blocks is None:
-            self._blocks = self._fetch_linked('blocks', 'blocked', (Bug,))
-        return self._blocks
+        try:
+            return self._blocks
+        except AttributeError:
+            self._fetch_all_relations()
+            return self._blocks
 
-    _blockedby = None
     @property
     def blockedby(self):
         """Bugs this bug blocks."""
-        if self._blockedby is None:
-            self._blockedby = self._fetch_linked('blockedby', 'blocker', (Bug,))
-        return self._blockedby
+        try:
+            return self._blockedby
+        except AttributeError:
+            self._fetch_all_relations()
+            return self._blockedby
 
-    _merged_with = None
     @property
     def merged_with(self):
         """Bug that has been merge with this one."""
-        if self._merged_with is None:
-            self._merged_with = self._fetch_linked('merged_with',
-                    'merged_with', (Bug,))
-        return self._merged_with
+        try:
+            return self._merged_with
+        except AttributeError:
+            self._fetch_all_relations()
+            return self._merged_with
 
-    _fixed_in = None
     @property
     def fixed_in(self):
         """The version this bug has been fixed in."""
-        if self._fixed_in is None:
-            self._fixed_in = self._fetch_linked('fixed_in', 'version')
-        return self._fixed_in
+        try:
+            return self._fixed_in
+        except AttributeError:
+            self._fetch_all_relations()
+            return self._fixed_in
 
-    _found_in = None
     @property
     def found_in(self):
         """The version this bug has been found in."""
-        if self._found_in is None:
-            self._found_in = self._fetch_linked('found_in', 'version')
-        return self._found_in
+        try:
+            return self._found_in
+        except AttributeError:
+            self._fetch_all_relations()
+            return self._found_in
 
-    _tags = None
     @property
     def tags(self):
         """The tags of this bug"""
-        if self._tags is None:
-            self._tags = self._fetch_linked('tags', 'tag')
-        return self._tags
-
-    _usertags = None
-    @property
-    def usertags(self):
+        try:
+            return self._tags
+        except AttributeError:
+            self._fetch_all_relations()
+            return self._tags
+
+    # Archived bugs have to usertags.
+    @linked('usertags', ('email', 'tag'), tables=('bugs',))
+    def usertags(self, usertags):
         """The tags defined by users on this bug. This property is only
         available if this bug is not archived."""
-        if self._usertags is None:
-            if self.archived:
-                print repr(self._table)
-                # Archived bugs have to usertags.
-                self._usertags = []
-            else:
-                self._usertags = self._fetch_linked('usertags', ('email', 'tag'))
-        return self._tags
+        return usertags
 
-    _packages = None
-    @property
-    def packages(self):
+    @linked('packages', ('package', 'source'))
+    def packages(self, packages):
         """The version this bug has been found in.
         This property is a list of tuples (binary, source), where the source
         package may be None."""
-        if self._packages is None:
-            self._packages = self._fetch_linked('packages',
-                    ('package', 'source'))
-        return self._packages
+        return packages
 
 
 class Developper(UddResource):
@@ -436,35 +1086,24 @@ class Developper(UddResource):
     _table = ('carnivore_login',)
     _fields = ('id', 'login')
     _computed_fields = ('emails', 'keys', 'names')
+    __slots__ = ('_emails', '_keys', '_names')
 
-    _emails = None
-    @property
-    def emails(self):
+    @linked('emails', 'email', base_table_name='carnivore_')
+    def emails(self, emails):
         """The email addresses of this developer."""
-        if self._emails is None:
-            self._emails = self._fetch_linked('emails', 'email',
-                    base_table_name='carnivore_')
-        return self._emails
+        return emails
 
-    _keys = None
-    @property
-    def keys(self):
+    @linked('keys', ('key', 'key_type'), base_table_name='carnivore_')
+    def keys(self, keys):
         """The key of this developer.
         A list of tuples (key, key_type)."""
-        if self._keys is None:
-            self._keys = self._fetch_linked('keys', ('key', 'key_type'),
-                    base_table_name='carnivore_')
-        return self._keys
+        return keys
 
-    _names = None
-    @property
-    def names(self):
+    @linked('names', 'name', base_table_name='carnivore_')
+    def names(self, names):
         """The names of this developer.
         """
-        if self._names is None:
-            self._names = self._fetch_linked('names', 'name',
-                    base_table_name='carnivore_')
-        return self._names
+        return names
 
 
 class Package(UddResource):
@@ -473,12 +1112,11 @@ class Package(UddResource):
     DISTINCT(package) from the subpackages list. 
     """
     _path = 'packages'
+    _table = 'packages'
     _pk = ('package',)
     _fields = ('package',)
     _computed_fields = ('subpackages', 'tags',)
-
-    def __init__(self, package):
-        self._data = {'package': package}
+    __slots__ = ('_tags',)
 
     @classmethod
     def fetch_database(cls, pk=None, package=None):
@@ -486,34 +1124,40 @@ class Package(UddResource):
         pk = pk or package
         if pk is not None:
             query += ' WHERE package=%s'
-        cur = UddResource.cursor()
-        try:
-            logging.debug('query: ' + query)
-            cur.execute(query, (pk,))
+        logging.debug('query: %s', query)
+        with get_conn() as cur:
             if pk is None:
-                return [Package(package=x) for x in cur.fetchall()]
+                cur.execute(query)
+                return [data2object(Package, x) for x in cur]
             else:
+                cur.execute(query, (pk,), prepare=True)
                 obj = cur.fetchone()
                 if obj is None:
                     raise ObjectNotFound()
                 else:
-                    return Package(package=pk)
-        finally:
-            cur.close()
+                    return data2object(Package, (pk,))
+
+    @classmethod
+    def fetch_stream(cls):
+        """Yield all packages, reading them from a server-side cursor.
+        """
+        query = 'SELECT DISTINCT(package) AS package FROM packages'
+        logging.debug('query: %s', query)
+        with get_conn(name='udd_stream') as cur:
+            cur.itersize = 2000
+            cur.execute(query)
+            for x in cur:
+                yield data2object(Package, x)
 
     @property
     def name(self):
-        return self._data['package']
+        return self.package
 
-    _tags = None
-    @property
-    def tags(self):
+    @linked('', 'tag', base_table_name='debtags')
+    def tags(self, tags):
         """The debtags associated with this package.
         """
-        if self._tags is None:
-            self._tags = self._fetch_linked('', 'tag',
-                    base_table_name='debtags')
-        return self._tags
+        return tags
 
     def get_subpackages(self, **kwargs):
         """Get all subpackages matching the criterions.
@@ -538,6 +1182,7 @@ class SubPackage(UddResource):
             'component')
     _path = 'subpackages'
     _table = 'packages'
+    _binary = False # `version` is a debversion
     _fields = ('package', 'version', 'architecture', 'maintainer',
             'maintainer_name', 'maintainer_email', 'description',
             'long_description', 'source', 'source_version',
@@ -549,39 +1194,29 @@ class SubPackage(UddResource):
             'original_maintainer', 'distribution', 'release', 'component',
             'ruby_versions')
     _computed_fields = ('descriptions', 'lintian')
+    __slots__ = ('_descriptions', '_lintian')
 
-    _descriptions = None
-    @property
-    def descriptions(self):
+    @linked('', ('language', 'description', 'long_description', 'md5sum'),
+            base_table_name='ddtp', exclude_from_pk=('architecture',))
+    def descriptions(self, descriptions):
         """Descriptions of the package in multiple languages.
         """
-        if self._descriptions is None:
-            descriptions = self._fetch_linked('', 
-                    ('language', 'description', 'long_description', 'md5sum'),
-                    base_table_name='ddtp', exclude_from_pk=('architecture',))
-            self._descriptions = dict([(x[0], {'description': x[1],
-                                               'long_description': x[2],
-                                               'md5sum': x[3]},
-                                       ) for x in descriptions])
-        return self._descriptions
-
-    _lintian = None
-    @property
-    def lintian(self):
+        return dict([(x[0], {'description': x[1],
+                             'long_description': x[2],
+                             'md5sum': x[3]},
+                     ) for x in descriptions])
+
+    @linked('', ('package_type', 'tag', 'information',
+            'package_arch', 'package_version'),
+            base_table_name='lintian',
+            exclude_from_pk=('distribution', 'release', 'component',
+                             'architecture', 'version'))
+    def lintian(self, lintian):
         """Lintian data for this package.
         """
-        if self._lintian is None:
-            lintian = self._fetch_linked('', 
-                    ('package_type', 'tag', 'information',
-                    'package_arch', 'package_version'),
-                    base_table_name='lintian',
-                    exclude_from_pk=('distribution', 'release', 'component',
-                                     'architecture', 'version'))
-            lintian = [dict(zip(['type', 'tag', 'information'], x))
-                       for x in lintian
-                       if x[3:] == (self.architecture, self.version)]
-            self._lintian = lintian
-        return self._lintian
+        return [dict(zip(['type', 'tag', 'information'], x))
+                for x in lintian
+                if x[3:] == (self.architecture, self.version)]
 
 
 
@@ -590,15 +1225,44 @@ class Popcon(UddResource):
     """
     _path = 'popcon'
     _table = 'popcon'
-    _fields = ['package', 'insts', 'vote', 'olde', 'recent', 'nofiles']
+    _fields = ('package', 'insts', 'vote', 'olde', 'recent', 'nofiles')
+    # Types of the fields, needed to parse the binary format of COPY.
+    _copy_types = ('text', 'int4', 'int4', 'int4', 'int4', 'int4')
+    __slots__ = ()
+
+    @classmethod
+    def bulk_load(cls):
+        """Returns all fields of all objects of this resource, like
+        :method:`uddlib.UddResource.fetch_columns`, but reads the whole table
+        with a binary COPY, which is much faster than a SELECT for a table
+        of this size.
+
+        :returns: a dictionary mapping each field name to the list of its
+                  values, in the same order for all fields.
+        """
+        query = sql.SQL('COPY {table} ({fields}) TO STDOUT (FORMAT BINARY)') \
+                .format(table=sql.Identifier(cls._table),
+                        fields=cls._fields_sql).as_string(None)
+        logging.debug('query: %s', query)
+        with get_conn(binary=True) as cur:
+            with cur.copy(query) as copy:
+                copy.set_types(cls._copy_types)
+                rows = list(copy.rows())
+        columns = zip(*rows) if rows else [()] * len(cls._fields)
+        return dict([(field, list(values))
+                     for (field, values) in zip(cls._fields, columns)])
 
 class PopconSrc(Popcon):
     _path = 'popcon_src'
     _table = 'popcon_src'
+    _fields = ('source', 'insts', 'vote', 'olde', 'recent', 'nofiles')
+    __slots__ = ()
 
 class PopconSrcAverage(Popcon):
     _path = 'popcon_src_average'
     _table = 'popcon_src_average'
+    _fields = ('source', 'insts', 'vote', 'olde', 'recent', 'nofiles')
+    __slots__ = ()
 
 
 class Source(UddResource):
@@ -606,32 +1270,32 @@ class Source(UddResource):
     """
     _path = 'sources'
     _table = 'sources'
+    _binary = False # `version` is a debversion
     _pk = ('source', 'version', 'distribution', 'release')
     _fields = ('source', 'version', 'maintainer', 'maintainer_name',
             'maintainer_email', 'format', 'files', 'uploaders', 'bin',
-            'artchitecture', 'standards_version', 'homepage', 'build_depends',
+            'architecture', 'standards_version', 'homepage', 'build_depends',
             'build_depends_indep', 'build_conflicts', 'build_conflicts_indep',
-            'priority', 'section', 'distribution', 'release', 'componenet',
+            'priority', 'section', 'distribution', 'release', 'component',
             'vcs_type', 'vcs_url', 'vcs_browser', 'python_version',
             'checksums_sha1', 'checksums_sha256', 'original_maintainer',
             'dm_upload_allowed', 'ruby_versions')
     _computed_fields = ('uploaders',)
+    __slots__ = ('_uploaders',)
 
-    _uploaders = None
-    @property
-    def uploaders(self):
+    @linked('', ('uploader', 'name', 'email'), base_table_name='uploaders')
+    def uploaders(self, uploaders):
         """People who can upload a new source package.
         """
-        if self._uploaders is None:
-            self._uploaders = self._fetch_linked('', ('uploader', 'name', 'email'),
-                    base_table_name='uploaders')
-        return self._uploaders
+        return uploaders
 
 class Uploader(UddResource):
     """Source packages uploaders.
     """
     _path = 'uploaders'
     _table = ('uploaders',)
+    _binary = False # `version` is a debversion
     _fields = ('source', 'version', 'distribution', 'release', 'component',
             'uploader', 'name', 'email')
     _pk = _fields
+    __slots__ = ()